@@ -1,8 +1,19 @@
 import hashlib
 import json
+import threading
 import time
 import uuid
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Set, Any, Optional
+
+
+# Proof of Work tuning
+DEFAULT_DIFFICULTY = 4       # leading hex zeros required (genesis and baseline)
+MIN_DIFFICULTY = 1
+MAX_DIFFICULTY = 8
+TARGET_BLOCK_TIME = 10       # seconds between blocks we aim for (consensus rule, same on every node)
+DIFFICULTY_WINDOW = 5        # recent blocks used to measure the block interval
+MAX_FUTURE_DRIFT = 120       # seconds a block timestamp may be ahead of our clock
+SIDE_BRANCH_DEPTH = 100      # side-branch blocks further below the tip are evicted
 
 
 class Transaction:
@@ -40,12 +51,14 @@ class Transaction:
 
 class Block:
     def __init__(self, index: int, transactions: List[Transaction], 
-                 proof: int, previous_hash: str, timestamp: int = None):
+                 proof: int, previous_hash: str, timestamp: int = None,
+                 difficulty: int = DEFAULT_DIFFICULTY):
         self.index = index
         self.timestamp = timestamp if timestamp is not None else int(time.time())
         self.transactions = transactions
         self.proof = proof
         self.previous_hash = previous_hash
+        self.difficulty = difficulty
     
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -53,7 +66,8 @@ class Block:
             "timestamp": self.timestamp,
             "transactions": [tx.to_dict() for tx in self.transactions],
             "proof": self.proof,
-            "previous_hash": self.previous_hash
+            "previous_hash": self.previous_hash,
+            "difficulty": self.difficulty
         }
     
     @classmethod
@@ -64,19 +78,93 @@ class Block:
             transactions=transactions,
             proof=data["proof"],
             previous_hash=data["previous_hash"],
-            timestamp=data.get("timestamp")  # ← Adicionar timestamp
+            timestamp=data.get("timestamp"),  # ← Adicionar timestamp
+            difficulty=data.get("difficulty", DEFAULT_DIFFICULTY)
         )
     
+    def work(self) -> int:
+        # Expected number of hashes needed to find a proof at this difficulty
+        return 16 ** self.difficulty
+    
     def compute_hash(self) -> str:
         block_string = json.dumps(self.to_dict(), sort_keys=True).encode()
         return hashlib.sha256(block_string).hexdigest()
 
 
+class BlockHeader:
+    """Block without its transactions, kept in memory after the body is pruned."""
+    
+    def __init__(self, index: int, timestamp: int, proof: int, previous_hash: str,
+                 difficulty: int, block_hash: str):
+        self.index = index
+        self.timestamp = timestamp
+        self.proof = proof
+        self.previous_hash = previous_hash
+        self.difficulty = difficulty
+        self.hash = block_hash
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "timestamp": self.timestamp,
+            "proof": self.proof,
+            "previous_hash": self.previous_hash,
+            "difficulty": self.difficulty,
+            "hash": self.hash
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'BlockHeader':
+        return cls(
+            index=data["index"],
+            timestamp=data["timestamp"],
+            proof=data["proof"],
+            previous_hash=data["previous_hash"],
+            difficulty=data["difficulty"],
+            block_hash=data["hash"]
+        )
+    
+    @classmethod
+    def from_block(cls, block: Block) -> 'BlockHeader':
+        return cls(
+            index=block.index,
+            timestamp=block.timestamp,
+            proof=block.proof,
+            previous_hash=block.previous_hash,
+            difficulty=block.difficulty,
+            block_hash=block.compute_hash()
+        )
+    
+    def work(self) -> int:
+        return 16 ** self.difficulty
+    
+    def compute_hash(self) -> str:
+        # The body is gone, so the hash recorded at pruning time is authoritative
+        return self.hash
+
+
 class Blockchain:
-    def __init__(self, node_id: str = None):
+    def __init__(self, node_id: str = None, prune_depth: int = 0):
         self.chain: List[Block] = []
         self.mempool: List[Transaction] = []
         self.node_id = node_id or "unknown"
+        
+        # Pruning: keep only the last prune_depth full blocks (0 disables it).
+        # Older blocks survive as headers, their transactions as materialized records:
+        # record id -> latest text, with UPDATEs folded in and not kept themselves.
+        self.prune_depth = prune_depth
+        self.headers: List[BlockHeader] = []
+        self.records: Dict[str, str] = {}
+        
+        # Block tree: every full block we know (active chain and side branches) by hash,
+        # plus an index of the transactions on the active chain
+        self.blocks: Dict[str, Block] = {}
+        self.side_hashes: Set[str] = set()
+        self.tx_index: Dict[str, Block] = {}
+        
+        # Guards the chain and the mempool against the mining, consensus and request threads
+        self.lock = threading.RLock()
+        
         self.create_genesis_block()
     
     def create_genesis_block(self):
@@ -95,10 +183,26 @@ class Blockchain:
             previous_hash="0",
             timestamp=genesis_timestamp
         )
-        self.chain.append(genesis_block)
+        self.connect_block(genesis_block)
     
-    def get_last_block(self) -> Block:
-        return self.chain[-1] if self.chain else None
+    def get_last_block(self) -> Optional[Block]:
+        if self.chain:
+            return self.chain[-1]
+        # Right after loading a snapshot only headers are held
+        return self.headers[-1] if self.headers else None
+    
+    def get_height(self) -> int:
+        last_block = self.get_last_block()
+        return last_block.index if last_block else 0
+    
+    def get_recent_blocks(self, count: int, end: int = None) -> List[Block]:
+        # Last count blocks before self.chain[end], falling back to pruned headers
+        if end is None:
+            end = len(self.chain)
+        recent = self.chain[max(0, end - count):end]
+        if len(recent) < count and self.headers:
+            recent = self.headers[-(count - len(recent)):] + recent
+        return recent
     
     def add_transaction(self, text: str, tx_type: str = "TX", 
                        replaces: str = None) -> Transaction:
@@ -108,102 +212,185 @@ class Blockchain:
             replaces=replaces,
             origin_node=self.node_id
         )
-        self.mempool.append(transaction)
+        with self.lock:
+            self.mempool.append(transaction)
         return transaction
     
+    def add_transactions(self, texts: List[str]) -> List[Transaction]:
+        # Batch admission: one timestamp and one mempool extend for the whole batch
+        timestamp = int(time.time())
+        transactions = [
+            Transaction(text=text, origin_node=self.node_id, timestamp=timestamp)
+            for text in texts
+        ]
+        with self.lock:
+            self.mempool.extend(transactions)
+        return transactions
+    
     def get_transaction_by_id(self, tx_id: str) -> Optional[Transaction]:
-        # Search in mempool first
-        for tx in self.mempool:
-            if tx.id == tx_id:
-                return tx
-        
-        # Search in chain
-        for block in self.chain:
-            for tx in block.transactions:
+        with self.lock:
+            # Search in mempool first
+            for tx in self.mempool:
                 if tx.id == tx_id:
                     return tx
-        return None
+            
+            # Search in chain
+            block = self.tx_index.get(tx_id)
+            if block:
+                for tx in block.transactions:
+                    if tx.id == tx_id:
+                        return tx
+            
+            # Search in pruned records
+            if tx_id in self.records:
+                return self.record_to_transaction(tx_id, self.records[tx_id])
+            return None
     
     def update_transaction(self, tx_id: str, new_text: str) -> Optional[Transaction]:
-        tx = self.get_transaction_by_id(tx_id)
-        if not tx:
-            return None
-        
-        # If transaction is still in mempool, update it directly
-        if tx in self.mempool:
-            tx.text = new_text
-            return tx
+        with self.lock:
+            tx = self.get_transaction_by_id(tx_id)
+            if not tx:
+                return None
+            
+            # If transaction is still in mempool, update it directly
+            # (under the lock, so no block can take it between the check and the edit)
+            if tx in self.mempool:
+                tx.text = new_text
+                return tx
         
-        # If transaction is already mined, create UPDATE transaction
+        # If transaction is already mined, create UPDATE transaction.
+        # Updating an UPDATE replaces the original record, so pruning can fold it.
         update_tx = self.add_transaction(
             text=new_text,
             tx_type="UPDATE",
-            replaces=tx_id
+            replaces=tx.replaces if tx.type == "UPDATE" else tx_id
         )
         return update_tx
     
-    def proof_of_work(self, last_proof: int) -> int:
+    def proof_of_work(self, last_proof: int, difficulty: int = DEFAULT_DIFFICULTY) -> int:
         proof = 0
-        while not self.valid_proof(last_proof, proof):
+        while not self.valid_proof(last_proof, proof, difficulty):
             proof += 1
         return proof
     
     @staticmethod
-    def valid_proof(last_proof: int, proof: int) -> bool:
+    def valid_proof(last_proof: int, proof: int,
+                    difficulty: int = DEFAULT_DIFFICULTY) -> bool:
         guess = f'{last_proof}{proof}'.encode()
         guess_hash = hashlib.sha256(guess).hexdigest()
-        return guess_hash[:4] == "0000"
+        return guess_hash[:difficulty] == "0" * difficulty
     
-    def mine_block(self) -> Optional[Block]:
-        if not self.mempool:
-            return None
+    def expected_difficulty(self, chain: List[Block], position: int) -> int:
+        """Difficulty the block at chain[position] must carry.
         
-        last_block = self.get_last_block()
-        last_proof = last_block.proof
-        proof = self.proof_of_work(last_proof)
-        
-        # Create new block with transactions from mempool
-        new_block = Block(
-            index=len(self.chain) + 1,
-            transactions=self.mempool.copy(),
-            proof=proof,
-            previous_hash=last_block.compute_hash()
-        )
+        Looks at the timestamps of the last DIFFICULTY_WINDOW blocks before it
+        (genesis excluded, its timestamp is fixed at 0) and moves one step
+        towards the target block interval. Only the last DIFFICULTY_WINDOW
+        entries before position are read, so headers work as well as blocks.
+        """
+        previous_block = chain[position - 1]
+        window = [block for block in chain[max(0, position - DIFFICULTY_WINDOW):position]
+                  if block.index > 1]
+        if len(window) < 2:
+            return previous_block.difficulty
         
-        # Clear mempool and add block to chain
-        self.mempool.clear()
-        self.chain.append(new_block)
+        average_interval = (window[-1].timestamp - window[0].timestamp) / (len(window) - 1)
+        difficulty = previous_block.difficulty
+        if average_interval < TARGET_BLOCK_TIME / 2:
+            difficulty += 1
+        elif average_interval > TARGET_BLOCK_TIME * 2:
+            difficulty -= 1
         
-        return new_block
+        return max(MIN_DIFFICULTY, min(MAX_DIFFICULTY, difficulty))
+    
+    def get_next_difficulty(self) -> int:
+        recent = self.get_recent_blocks(DIFFICULTY_WINDOW)
+        return self.expected_difficulty(recent, len(recent))
+    
+    def mine_block(self) -> Optional[Block]:
+        while True:
+            if not self.mempool:
+                return None
+            
+            last_block = self.get_last_block()
+            last_proof = last_block.proof
+            difficulty = self.get_next_difficulty()
+            proof = self.proof_of_work(last_proof, difficulty)
+            
+            with self.lock:
+                # Consensus may have switched the chain while we were hashing
+                if self.get_last_block() is not last_block:
+                    continue
+                if not self.mempool:
+                    return None
+                
+                # Create new block with transactions from mempool
+                new_block = Block(
+                    index=last_block.index + 1,
+                    transactions=self.mempool.copy(),
+                    proof=proof,
+                    previous_hash=last_block.compute_hash(),
+                    # Timestamps must strictly increase, even for blocks mined in the same second
+                    timestamp=max(int(time.time()), last_block.timestamp + 1),
+                    difficulty=difficulty
+                )
+                
+                # Clear mempool and add block to chain
+                self.mempool.clear()
+                self.connect_block(new_block)
+                self.prune()
+                
+                return new_block
     
-    def is_chain_valid(self, chain: List[Block] = None) -> bool:
+    def is_chain_valid(self, chain: List[Block] = None,
+                       base: List[BlockHeader] = None) -> bool:
+        # base: already trusted blocks/headers that chain extends (e.g. our pruned headers)
         if chain is None:
             chain = self.chain
+            base = self.headers
+        base = base or []
+        full_chain = base + chain
         
         # Check if chain has at least genesis block
-        if len(chain) == 0:
-            return False
-        
-        # Check genesis block
-        genesis = chain[0]
-        if genesis.index != 1 or genesis.previous_hash != "0":
+        if len(full_chain) == 0:
             return False
         
-        # Check if genesis has ROOT transaction
-        if len(genesis.transactions) != 1 or genesis.transactions[0].type != "ROOT":
-            return False
+        if not base:
+            # Check genesis block
+            genesis = chain[0]
+            if genesis.index != 1 or genesis.previous_hash != "0":
+                return False
+            if genesis.difficulty != DEFAULT_DIFFICULTY:
+                return False
+            
+            # Check if genesis has ROOT transaction
+            if len(genesis.transactions) != 1 or genesis.transactions[0].type != "ROOT":
+                return False
         
         # Check all blocks
-        for i in range(1, len(chain)):
-            current_block = chain[i]
-            previous_block = chain[i - 1]
+        max_timestamp = int(time.time()) + MAX_FUTURE_DRIFT
+        for i in range(max(1, len(base)), len(full_chain)):
+            current_block = full_chain[i]
+            previous_block = full_chain[i - 1]
+            
+            if current_block.index != previous_block.index + 1:
+                return False
+            
+            # Check timestamps, they drive the retarget: increasing and not in the future
+            if not previous_block.timestamp < current_block.timestamp <= max_timestamp:
+                return False
             
             # Check previous_hash
             if current_block.previous_hash != previous_block.compute_hash():
                 return False
             
+            # Check difficulty follows the retarget rule
+            if current_block.difficulty != self.expected_difficulty(full_chain, i):
+                return False
+            
             # Check proof of work
-            if not self.valid_proof(previous_block.proof, current_block.proof):
+            if not self.valid_proof(previous_block.proof, current_block.proof,
+                                    current_block.difficulty):
                 return False
         
         return True
@@ -211,28 +398,272 @@ class Blockchain:
     def get_all_transactions(self) -> List[Transaction]:
         all_tx = []
         
-        # Add transactions from chain
-        for block in self.chain:
-            all_tx.extend(block.transactions)
-        
-        # Add pending transactions
-        all_tx.extend(self.mempool)
+        # Under the lock: pruning moves blocks into records while we iterate
+        with self.lock:
+            # Add records materialized from pruned blocks
+            all_tx.extend(self.record_to_transaction(tx_id, text)
+                          for tx_id, text in self.records.items())
+            
+            # Add transactions from chain
+            for block in self.chain:
+                all_tx.extend(block.transactions)
+            
+            # Add pending transactions
+            all_tx.extend(self.mempool)
         
         return all_tx
     
+    @staticmethod
+    def get_chain_work(chain: List[Block]) -> int:
+        return sum(block.work() for block in chain)
+    
+    def connect_block(self, block: Block):
+        block_hash = block.compute_hash()
+        self.chain.append(block)
+        self.blocks[block_hash] = block
+        self.side_hashes.discard(block_hash)
+        for tx in block.transactions:
+            self.tx_index[tx.id] = block
+    
+    def disconnect_tip(self) -> Block:
+        block = self.chain.pop()
+        for tx in block.transactions:
+            self.tx_index.pop(tx.id, None)
+        # The block stays in self.blocks as a side branch
+        self.side_hashes.add(block.compute_hash())
+        return block
+    
+    def evict_side_branches(self):
+        # Without this, side branches would pile up for the life of the process
+        min_index = self.get_height() - SIDE_BRANCH_DEPTH
+        for block_hash in list(self.side_hashes):
+            block = self.blocks.get(block_hash)
+            if block is None or block.index <= min_index:
+                self.blocks.pop(block_hash, None)
+                self.side_hashes.discard(block_hash)
+    
+    def is_active(self, block: Block) -> bool:
+        position = block.index - len(self.headers) - 1
+        return 0 <= position < len(self.chain) and self.chain[position] is block
+    
+    def find_attach_point(self, new_chain: List[Block]) -> Optional[int]:
+        """Position in self.chain where new_chain starts, or None if it does not
+        build on our active chain.
+        
+        new_chain may be just a peer's suffix: its first block only has to extend
+        one of our active blocks (or genesis / our last pruned header).
+        """
+        first = new_chain[0]
+        if first.index == len(self.headers) + 1:
+            if not self.headers or first.previous_hash == self.headers[-1].hash:
+                return 0
+            return None
+        
+        parent = self.blocks.get(first.previous_hash)
+        if parent is not None and self.is_active(parent):
+            return parent.index - len(self.headers)
+        return None
+    
+    def is_branch_valid(self, new_chain: List[Block]) -> bool:
+        # Validates new_chain on top of the part of our chain it builds on
+        with self.lock:
+            attach = self.find_attach_point(new_chain) if new_chain else None
+            if attach is None:
+                return False
+            return self.is_chain_valid(new_chain, self.get_recent_blocks(DIFFICULTY_WINDOW, attach))
+    
     def replace_chain(self, new_chain: List[Block]) -> bool:
-        if len(new_chain) <= len(self.chain):
-            return False
+        with self.lock:
+            if not self.is_branch_valid(new_chain):
+                return False
+            attach = self.find_attach_point(new_chain)
+            
+            # Skip the overlap we already have; the rest is the divergent branch
+            shared = 0
+            while shared < len(new_chain) and attach + shared < len(self.chain):
+                known = self.blocks.get(new_chain[shared].compute_hash())
+                if known is not self.chain[attach + shared]:
+                    break
+                shared += 1
+            fork = attach + shared
+            new_branch = new_chain[shared:]
+            
+            # Keep the branch in the tree even if we do not switch to it now
+            for block in new_branch:
+                block_hash = block.compute_hash()
+                if block_hash not in self.blocks:
+                    self.blocks[block_hash] = block
+                    self.side_hashes.add(block_hash)
+            
+            # Fork choice: most cumulative work wins, not the most blocks
+            replaced = self.get_chain_work(new_branch) > self.get_chain_work(self.chain[fork:])
+            if replaced:
+                self.reorganize(fork, new_branch)
+                self.prune()
+            
+            self.evict_side_branches()
+            return replaced
+    
+    def reorganize(self, fork: int, new_branch: List[Block]):
+        # Roll back our blocks after the fork point
+        rolled_back = []
+        while len(self.chain) > fork:
+            rolled_back.append(self.disconnect_tip())
+        orphaned = [tx for block in reversed(rolled_back) for tx in block.transactions]
         
-        if not self.is_chain_valid(new_chain):
-            return False
+        # Apply the new branch
+        for block in new_branch:
+            self.connect_block(block)
         
-        self.chain = new_chain
-        return True
+        # Orphaned transactions the new branch did not include go back to the mempool.
+        # Mutated in place: request threads hold and append to this same list.
+        self.mempool[:] = [tx for tx in orphaned + self.mempool if tx.id not in self.tx_index]
+    
+    def get_total_work(self, chain: List[Block] = None) -> int:
+        # With chain (a branch building on ours): total work if we switched to it
+        with self.lock:
+            total = self.get_chain_work(self.headers) + self.get_chain_work(self.chain)
+            if chain is None:
+                return total
+            attach = self.find_attach_point(chain)
+            if attach is None:
+                return 0
+            return total - self.get_chain_work(self.chain[attach:]) + self.get_chain_work(chain)
+    
+    def get_chain_fingerprint(self, chain: List[Block] = None) -> str:
+        tip = chain[-1] if chain else self.get_last_block()
+        return f"{self.get_total_work(chain or None)}:{tip.compute_hash()}"
+    
+    @staticmethod
+    def apply_block_to_records(records: Dict[str, str], block: Block):
+        for tx in block.transactions:
+            if tx.type == "UPDATE":
+                # Folded into the record it replaces; the UPDATE itself is not kept
+                if tx.replaces in records:
+                    records[tx.replaces] = tx.text
+            else:
+                records[tx.id] = tx.text
     
-    def get_chain_fingerprint(self) -> str:
-        if not self.chain:
-            return "empty"
+    @staticmethod
+    def record_to_transaction(tx_id: str, text: str) -> Transaction:
+        # Only id and latest text survive pruning; ROOT keeps its fixed genesis fields
+        if tx_id == "root":
+            return Transaction(text=text, tx_type="ROOT", tx_id=tx_id,
+                               origin_node="genesis", timestamp=0)
+        return Transaction(text=text, tx_id=tx_id, origin_node="pruned", timestamp=0)
+    
+    def materialize_records(self) -> Dict[str, str]:
+        with self.lock:
+            records = dict(self.records)
+            for block in self.chain:
+                self.apply_block_to_records(records, block)
+            return records
+    
+    def prune(self):
+        if not self.prune_depth:
+            return
         
-        last_block = self.get_last_block()
-        return f"{len(self.chain)}:{last_block.compute_hash()}"
+        excess = len(self.chain) - self.prune_depth
+        if excess <= 0:
+            return
+        
+        for block in self.chain[:excess]:
+            self.apply_block_to_records(self.records, block)
+            self.headers.append(BlockHeader.from_block(block))
+            for tx in block.transactions:
+                self.tx_index.pop(tx.id, None)
+        self.chain = self.chain[excess:]
+        
+        # Side branches forking below the pruned height can no longer be reorged to
+        height = len(self.headers)
+        self.blocks = {h: block for h, block in self.blocks.items() if block.index > height}
+        self.side_hashes.intersection_update(self.blocks)
+    
+    @staticmethod
+    def compute_checkpoint(snapshot: Dict[str, Any]) -> str:
+        # Plain digest of the snapshot content, anyone can recompute it. It lets nodes
+        # compare snapshots from different peers; it does not prove who produced them.
+        content = {key: value for key, value in snapshot.items() if key != "checkpoint"}
+        snapshot_string = json.dumps(content, sort_keys=True).encode()
+        return hashlib.sha256(snapshot_string).hexdigest()
+    
+    def create_snapshot(self) -> Dict[str, Any]:
+        # Tip, headers and records must all come from the same chain state
+        with self.lock:
+            last_block = self.get_last_block()
+            headers = self.headers + [BlockHeader.from_block(block) for block in self.chain]
+            snapshot = {
+                "height": last_block.index,
+                "tip_hash": last_block.compute_hash(),
+                "work": self.get_total_work(),
+                "headers": [header.to_dict() for header in headers],
+                "records": self.materialize_records()
+            }
+        
+        snapshot["checkpoint"] = self.compute_checkpoint(snapshot)
+        return snapshot
+    
+    @staticmethod
+    def is_header_well_formed(header: BlockHeader) -> bool:
+        return (all(isinstance(value, int) and not isinstance(value, bool)
+                    for value in (header.index, header.timestamp, header.proof, header.difficulty))
+                and isinstance(header.previous_hash, str)
+                and isinstance(header.hash, str))
+    
+    @staticmethod
+    def is_record_well_formed(tx_id: Any, text: Any) -> bool:
+        return isinstance(tx_id, str) and isinstance(text, str)
+    
+    def is_snapshot_valid(self, snapshot: Dict[str, Any]) -> bool:
+        try:
+            if snapshot["checkpoint"] != self.compute_checkpoint(snapshot):
+                return False
+            
+            headers = [BlockHeader.from_dict(h) for h in snapshot["headers"]]
+            if not headers or not all(self.is_header_well_formed(h) for h in headers):
+                return False
+            
+            records = snapshot["records"]
+            if not isinstance(records, dict):
+                return False
+            if not all(self.is_record_well_formed(tx_id, text)
+                       for tx_id, text in records.items()):
+                return False
+            
+            # Headers must start at our own genesis (every field, not just the claimed
+            # hash, since difficulty counts towards work) and carry valid PoW up to the tip
+            genesis = self.headers[0] if self.headers else self.chain[0]
+            genesis_header = genesis if isinstance(genesis, BlockHeader) else BlockHeader.from_block(genesis)
+            if headers[0].to_dict() != genesis_header.to_dict():
+                return False
+            if not self.is_chain_valid(headers[1:], [genesis]):
+                return False
+            
+            tip = headers[-1]
+            return (snapshot["height"] == tip.index
+                    and snapshot["tip_hash"] == tip.compute_hash()
+                    and snapshot["work"] == self.get_chain_work(headers))
+        except (KeyError, TypeError, AttributeError):
+            return False
+    
+    def load_snapshot(self, snapshot: Dict[str, Any]) -> bool:
+        if not self.is_snapshot_valid(snapshot):
+            return False
+        
+        with self.lock:
+            if snapshot["work"] <= self.get_total_work():
+                return False
+            
+            # Transactions only in our own blocks outside the snapshot go back to the mempool
+            snapshot_hashes = {h["hash"] for h in snapshot["headers"]}
+            orphaned = [tx for block in self.chain if block.compute_hash() not in snapshot_hashes
+                        for tx in block.transactions]
+            
+            self.headers = [BlockHeader.from_dict(h) for h in snapshot["headers"]]
+            self.records = dict(snapshot["records"])
+            self.chain = []
+            self.blocks = {}
+            self.side_hashes = set()
+            self.tx_index = {}
+            self.mempool[:] = [tx for tx in orphaned + self.mempool if tx.id not in self.records]
+            return True
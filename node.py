@@ -2,9 +2,90 @@ from flask import Flask, request, jsonify, render_template
 import requests
 import threading
 import time
+import json
+import codecs
 import os
 from blockchain import Blockchain, Block, Transaction
-from typing import Dict, List, Set, Optional
+from typing import Dict, List, Set, Optional, Iterator, Any, BinaryIO, Tuple
+
+
+BULK_CHUNK_SIZE = 64 * 1024       # bytes read from the request body at a time
+BULK_BATCH_SIZE = 1000            # transactions admitted to the mempool per batch
+BULK_MAX_RECORD_SIZE = 1024 * 1024
+
+SYNC_OVERLAP = 8                  # blocks below our tip requested first to find the fork
+
+
+def iter_json_records(stream: BinaryIO, chunk_size: int = BULK_CHUNK_SIZE) -> Iterator[Any]:
+    """Yield the JSON values of an NDJSON or JSON array body, reading it in chunks.
+    
+    Only the chunk being parsed (plus a record split across chunks) is kept in
+    memory. Raises ValueError on malformed input.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buffer = ""
+    pos = 0
+    in_array = None
+    # Array mode grammar: "value_or_end" after '[', "comma_or_end" after a value,
+    # "value" after ',', "done" after ']'
+    expect = "value"
+    eof = False
+    
+    while True:
+        while pos < len(buffer) and buffer[pos].isspace():
+            pos += 1
+        
+        if pos < len(buffer):
+            char = buffer[pos]
+            if in_array is None:
+                in_array = char == '['
+                if in_array:
+                    pos += 1
+                    expect = "value_or_end"
+                continue
+            
+            if in_array:
+                if expect == "done":
+                    raise ValueError("Unexpected data after JSON array")
+                if char == ']' and expect in ("value_or_end", "comma_or_end"):
+                    pos += 1
+                    expect = "done"
+                    continue
+                if char == ',' and expect == "comma_or_end":
+                    pos += 1
+                    expect = "value"
+                    continue
+                if expect == "comma_or_end" or char in ',]':
+                    raise ValueError(f"Unexpected '{char}' in JSON array")
+            
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Most likely a record split across chunks, read more below
+                if eof:
+                    raise
+                if len(buffer) - pos > BULK_MAX_RECORD_SIZE:
+                    raise ValueError("Record too large")
+            else:
+                # Only a closed object is surely complete; a scalar ending at the
+                # buffer end may continue in the next chunk ("1" + "2")
+                if end < len(buffer) or eof or isinstance(value, dict):
+                    pos = end
+                    if in_array:
+                        expect = "comma_or_end"
+                    yield value
+                    continue
+        elif eof:
+            if in_array and expect != "done":
+                raise ValueError("Unterminated JSON array")
+            return
+        
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        # Incremental decoding copes with characters split across chunks
+        buffer = buffer[pos:] + utf8.decode(chunk, final=eof)
+        pos = 0
 
 
 class Node:
@@ -12,7 +93,10 @@ class Node:
         self.app = Flask(__name__)
         self.port = port
         self.node_id = node_id
-        self.blockchain = Blockchain(node_id)
+        self.blockchain = Blockchain(
+            node_id,
+            prune_depth=int(os.getenv('PRUNE_DEPTH', 0))
+        )
         self.peers: Set[str] = set(peers or [])
         self.reliability_scores: Dict[str, Dict[str, int]] = {}
         self.fault_mode = "NORMAL"  # NORMAL, STOP, BYZANTINE
@@ -34,21 +118,43 @@ class Node:
             if self.fault_mode == "STOP":
                 return jsonify({"error": "Node stopped"}), 503
             
+            # Optional ?from=<index> lets pruned peers fetch only the tail they miss
+            start = request.args.get('from', default=1, type=int)
+            blocks = [block for block in self.blockchain.chain if block.index >= start]
+            
             if self.fault_mode == "BYZANTINE":
                 # Return corrupted chain
-                corrupted_chain = [block.to_dict() for block in self.blockchain.chain]
+                corrupted_chain = [block.to_dict() for block in blocks]
                 if len(corrupted_chain) > 1:
                     corrupted_chain[1]["previous_hash"] = "corrupted_hash"
                 return jsonify({
                     "chain": corrupted_chain,
-                    "length": len(corrupted_chain)
+                    "length": len(corrupted_chain),
+                    "height": self.blockchain.get_height()
                 })
             
             return jsonify({
-                "chain": [block.to_dict() for block in self.blockchain.chain],
-                "length": len(self.blockchain.chain)
+                "chain": [block.to_dict() for block in blocks],
+                "length": len(blocks),
+                "height": self.blockchain.get_height()
             })
         
+        @self.app.route('/snapshot')
+        def get_snapshot():
+            if self.fault_mode == "STOP":
+                return jsonify({"error": "Node stopped"}), 503
+            
+            snapshot = self.blockchain.create_snapshot()
+            
+            if self.fault_mode == "BYZANTINE":
+                # Tamper with the records and recompute the checkpoint, so the
+                # snapshot is self-consistent and only the majority vote rejects it
+                for tx_id in snapshot["records"]:
+                    snapshot["records"][tx_id] = "corrupted_record"
+                snapshot["checkpoint"] = self.blockchain.compute_checkpoint(snapshot)
+            
+            return jsonify(snapshot)
+        
         @self.app.route('/mine')
         def mine():
             if self.fault_mode == "STOP":
@@ -61,6 +167,7 @@ class Node:
                     "index": block.index,
                     "transactions": [tx.to_dict() for tx in block.transactions],
                     "proof": block.proof,
+                    "difficulty": block.difficulty,
                     "previous_hash": block.previous_hash
                 })
             else:
@@ -83,6 +190,40 @@ class Node:
                 "tx_id": transaction.id
             }), 201
         
+        @self.app.route('/transactions/bulk', methods=['POST'])
+        def bulk_transactions():
+            if self.fault_mode == "STOP":
+                return jsonify({"error": "Node stopped"}), 503
+            
+            # Body is NDJSON or a JSON array of {"text": ...}, parsed as it streams in
+            tx_ids = []
+            batch = []
+            try:
+                for record in iter_json_records(request.stream):
+                    if not isinstance(record, dict) or 'text' not in record:
+                        raise ValueError(f"Record {len(tx_ids) + len(batch) + 1}: missing text field")
+                    batch.append(record['text'])
+                    
+                    if len(batch) >= BULK_BATCH_SIZE:
+                        tx_ids.extend(tx.id for tx in self.blockchain.add_transactions(batch))
+                        batch = []
+            except ValueError as e:
+                # Batches admitted before the error stay in the mempool
+                return jsonify({
+                    "error": str(e),
+                    "count": len(tx_ids),
+                    "tx_ids": tx_ids
+                }), 400
+            
+            if batch:
+                tx_ids.extend(tx.id for tx in self.blockchain.add_transactions(batch))
+            
+            return jsonify({
+                "message": "Transactions added to mempool",
+                "count": len(tx_ids),
+                "tx_ids": tx_ids
+            }), 201
+        
         @self.app.route('/transactions/pending')
         def get_pending_transactions():
             if self.fault_mode == "STOP":
@@ -185,36 +326,66 @@ class Node:
             self.fault_mode = mode
             return jsonify({"message": f"Fault mode set to {mode}"})
     
-    def resolve_conflicts_internal(self) -> bool:
+    def fetch_peer_chain(self, peer: str) -> Tuple[Optional[List[Block]], int]:
+        """Fetch the part of a peer's chain above the point where it joins ours.
+        
+        Asks for SYNC_OVERLAP blocks below our tip and doubles the overlap until
+        the reply builds on our active chain, so the download scales with the
+        fork depth instead of the chain length. Returns (chain, peer height);
+        chain is None when the peer pruned past the blocks we would need.
+        Raises ValueError when the reply can never build on our chain.
+        """
+        floor = len(self.blockchain.headers) + 1
+        overlap = SYNC_OVERLAP
+        
+        while True:
+            start = max(floor, self.blockchain.get_height() - overlap + 1)
+            response = requests.get(f'http://{peer}/chain', params={'from': start}, timeout=2)
+            if response.status_code != 200:
+                raise ValueError(f"HTTP {response.status_code}")
+            
+            data = response.json()
+            chain = [Block.from_dict(block_data) for block_data in data['chain']]
+            height = data.get('height', 0)
+            
+            if not chain or self.blockchain.find_attach_point(chain) is not None:
+                return chain, height
+            if chain[0].index > start:
+                return None, height
+            if start == floor:
+                raise ValueError("Chain does not build on ours")
+            overlap *= 2
+    
+    def resolve_conflicts_internal(self, allow_snapshot: bool = True) -> bool:
         # Collect chains from all peers
         peer_chains = {}
         peer_fingerprints = {}
         
+        # Highest height reported by peers that pruned past the blocks we need
+        unservable_height = 0
+        
         for peer in self.peers:
             try:
-                response = requests.get(f'http://{peer}/chain', timeout=2)
-                if response.status_code == 200:
-                    data = response.json()
-                    chain_data = data['chain']
-                    
-                    # Convert to Block objects
-                    chain = []
-                    for block_data in chain_data:
-                        block = Block.from_dict(block_data)
-                        chain.append(block)
+                chain, height = self.fetch_peer_chain(peer)
+                
+                # Peer pruned past the blocks we miss, it cannot serve this tail
+                if chain is None:
+                    unservable_height = max(unservable_height, height)
+                    continue
+                # Peer has nothing above our tip
+                if not chain:
+                    continue
+                
+                # Validate only the fetched suffix, on top of our shared prefix
+                if self.blockchain.is_branch_valid(chain):
+                    peer_chains[peer] = chain
+                    fingerprint = self.blockchain.get_chain_fingerprint(chain)
+                    peer_fingerprints[peer] = fingerprint
                     
-                    # Validate chain
-                    if self.blockchain.is_chain_valid(chain):
-                        peer_chains[peer] = chain
-                        fingerprint = f"{len(chain)}:{chain[-1].compute_hash()}"
-                        peer_fingerprints[peer] = fingerprint
-                        
-                        # Update reliability score
-                        self.reliability_scores[peer]["ok_count"] += 1
-                    else:
-                        # Invalid chain
-                        self.reliability_scores[peer]["fail_count"] += 1
+                    # Update reliability score
+                    self.reliability_scores[peer]["ok_count"] += 1
                 else:
+                    # Invalid chain
                     self.reliability_scores[peer]["fail_count"] += 1
                     
             except Exception:
@@ -238,29 +409,84 @@ class Node:
                 winning_peers = voters
                 break
         
+        replaced = False
         if winning_fingerprint:
             # Use majority chain
             peer = winning_peers[0]
             new_chain = peer_chains[peer]
-            return self.blockchain.replace_chain(new_chain)
+            replaced = self.blockchain.replace_chain(new_chain)
         
-        # No majority - choose longest valid chain
-        if peer_chains:
-            longest_chain = max(peer_chains.values(), key=len)
+        # No majority - choose valid chain with most cumulative work
+        elif peer_chains:
+            chain_work = self.blockchain.get_total_work
+            heaviest_chain = max(peer_chains.values(), key=chain_work)
             
-            # If multiple chains have same length, choose from most reliable peer
-            same_length_chains = [chain for chain in peer_chains.values() if len(chain) == len(longest_chain)]
-            if len(same_length_chains) > 1:
+            # If multiple chains have same work, choose from most reliable peer
+            same_work_chains = [chain for chain in peer_chains.values()
+                                if chain_work(chain) == chain_work(heaviest_chain)]
+            if len(same_work_chains) > 1:
                 # Find most reliable peer
                 most_reliable_peer = min(
                     peer_chains.keys(),
                     key=lambda p: self.reliability_scores[p]["fail_count"]
                 )
-                longest_chain = peer_chains[most_reliable_peer]
+                heaviest_chain = peer_chains[most_reliable_peer]
             
-            return self.blockchain.replace_chain(longest_chain)
+            replaced = self.blockchain.replace_chain(heaviest_chain)
+        
+        # No peer could serve our tail and one is ahead of us: we fell behind by more
+        # than what pruning peers keep, so catch up from a snapshot
+        if (allow_snapshot and not peer_chains
+                and unservable_height > self.blockchain.get_height()):
+            return self.bootstrap_from_snapshot()
+        
+        return replaced
+    
+    def bootstrap_from_snapshot(self) -> bool:
+        # Collect snapshots from all peers
+        snapshots = {}
+        
+        for peer in self.peers:
+            try:
+                response = requests.get(f'http://{peer}/snapshot', timeout=5)
+                if response.status_code == 200:
+                    snapshot = response.json()
+                    if self.blockchain.is_snapshot_valid(snapshot):
+                        snapshots[peer] = snapshot
+                        self.reliability_scores[peer]["ok_count"] += 1
+                    else:
+                        self.reliability_scores[peer]["fail_count"] += 1
+                else:
+                    self.reliability_scores[peer]["fail_count"] += 1
+                    
+            except Exception:
+                self.reliability_scores[peer]["fail_count"] += 1
+        
+        if not snapshots:
+            return False
         
-        return False
+        # The records cannot be checked against the headers, so a snapshot is only
+        # adopted when a majority reports the same checkpoint - never on one peer's word
+        checkpoint_votes = {}
+        for peer, snapshot in snapshots.items():
+            checkpoint_votes.setdefault(snapshot["checkpoint"], []).append(peer)
+        
+        majority_threshold = 2
+        chosen = None
+        for voters in checkpoint_votes.values():
+            if len(voters) >= majority_threshold:
+                chosen = snapshots[voters[0]]
+                break
+        
+        if chosen is None:
+            return False
+        
+        if not self.blockchain.load_snapshot(chosen):
+            return False
+        
+        # Only the blocks mined after the snapshot still need to be synced
+        self.resolve_conflicts_internal(allow_snapshot=False)
+        return True
     
     def auto_register_peers(self):
         # Auto-register peers from environment or config
@@ -273,8 +499,9 @@ class Node:
                     self.reliability_scores[peer] = {"ok_count": 0, "fail_count": 0}
     
     def auto_mine(self):
+        # Block interval is paced by the adaptive PoW difficulty, not by this timer
         while True:
-            time.sleep(10)  # Mine every 10 seconds
+            time.sleep(1)
             if self.fault_mode != "STOP" and self.blockchain.mempool:
                 try:
                     self.blockchain.mine_block()
@@ -301,4 +528,10 @@ class Node:
     
     def run(self):
         self.auto_register_peers()
+        if self.blockchain.prune_depth:
+            try:
+                if not self.bootstrap_from_snapshot():
+                    print(f"Node {self.node_id}: no snapshot agreed by the majority, syncing blocks instead")
+            except Exception as e:
+                print(f"Node {self.node_id}: snapshot bootstrap failed: {e!r}")
         self.app.run(host='0.0.0.0', port=self.port, debug=False)